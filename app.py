@@ -1,6 +1,9 @@
+import asyncio
+import hmac
+import json
 import os
-import re
-import pandas as pd
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 
 # Must be the first Streamlit call
@@ -30,7 +33,7 @@ def require_password() -> None:
 
     # Enforce real secret if present
     if PASSWORD_SECRET:
-        if pwd != PASSWORD_SECRET:
+        if not hmac.compare_digest(pwd.encode("utf-8"), str(PASSWORD_SECRET).encode("utf-8")):
             st.error("❌ Incorrect password")
             st.stop()
     else:
@@ -46,78 +49,353 @@ require_password()
 # ----------------------------
 # The rest of the app is wrapped in a function
 # and only runs AFTER the gate passes.
+# Heavy modules (openai, PyMuPDF/PyPDF2) are imported where first used.
 # ----------------------------
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
-from openai import OpenAI
+from openai_common import (
+    MAX_CONCURRENT_REQUESTS, ResponseCache, content_digest, gather_by_content, make_async_client, make_client,
+    response_cache_key
+)
+from pdf_extraction import extract_text_cached
+from section_parsing import SECTIONS, section_values
+
+ANALYSIS_MODEL = "gpt-4o-mini"
+ANALYSIS_SYSTEM_PROMPT = "You are a precise legal document analyzer."
+ANALYSIS_INSTRUCTION = (
+    "Analyze this legal PDF and produce a concise, structured result with these sections:\n"
+    "1. Parties\n2. Effective Date\n3. Term\n4. Confidential Information\n"
+    "5. Obligations\n6. Jurisdiction\n7. Risk Flags"
+)
+
+# Above this many files, comparison mode offers the (cheaper, asynchronous) OpenAI Batch API
+BATCH_THRESHOLD = 20
+
+# Cap on worker threads used to parse uploaded PDFs in parallel
+MAX_EXTRACTION_WORKERS = 8
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache() -> ResponseCache:
+    """
+    OpenAI responses keyed by response_cache_key, shared across reruns and sessions.
+    Entries expire after CACHE_TTL_SECONDS; nothing is written to disk.
+    """
+    return ResponseCache()
 
 def extract_text_from_pdf(uploaded_file):
     """
     Read text from a single PDF (no pre-reads; keep UploadedFile intact).
     """
-    reader = PdfReader(uploaded_file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() or ""
-    return text.strip()
+    pdf_bytes = uploaded_file.getvalue()
+    return extract_text_cached(content_digest(pdf_bytes), pdf_bytes).strip()
 
-def analyze_text_full(text: str, instruction: str) -> str:
+def extract_texts(files) -> dict:
     """
-    Single-pass analysis using OpenAI v1 Chat Completions API (no chunking).
-    The client is initialized lazily here (after the password gate).
+    Parse several PDFs on a thread pool and return {filename: text}.
     """
+    with st.spinner(f"Extracting text from {len(files)} documents..."):
+        with ThreadPoolExecutor(max_workers=min(MAX_EXTRACTION_WORKERS, len(files))) as executor:
+            return dict(zip((f.name for f in files), executor.map(extract_text_from_pdf, files)))
+
+def get_openai_key() -> str:
     load_dotenv()
     OPENAI_KEY = st.secrets.get("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
     if not OPENAI_KEY:
         raise RuntimeError("OPENAI_API_KEY not found in st.secrets or environment variables.")
-    client = OpenAI(api_key=OPENAI_KEY)
-
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a precise legal document analyzer."},
-            {"role": "user", "content": f"{instruction}\n\n{text}"}
-        ],
-        temperature=0.2
+    return OPENAI_KEY
+
+@st.cache_resource(show_spinner=False)
+def get_client():
+    """
+    Sync OpenAI client, shared for the lifetime of the process so its connection pool stays warm.
+    AsyncOpenAI clients come from make_async_client(get_openai_key()), one per asyncio.run().
+    """
+    return make_client(get_openai_key())
+
+def build_messages(text: str, instruction: str) -> list:
+    """
+    Invariant content first and byte-for-byte identical across calls, document text last,
+    so OpenAI's automatic prompt caching can reuse the shared prefix.
+    """
+    return [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": instruction},
+        {"role": "user", "content": text}
+    ]
+
+async def analyze_text_full(text: str, instruction: str, placeholder=None, client=None) -> str:
+    """
+    Single-pass analysis using OpenAI v1 Chat Completions API (no chunking).
+    Pass the run's shared AsyncOpenAI client; without one, a client is opened for this call only.
+    The response is streamed; if a placeholder (st.empty()) is given, it is updated as tokens arrive.
+    """
+    model = ANALYSIS_MODEL
+    cache = get_response_cache()
+    key = response_cache_key(model, instruction, text)
+    cached = cache.get(key)
+    if cached is not None:
+        if placeholder is not None:
+            placeholder.markdown(cached)
+        return cached
+
+    if client is None:
+        async with make_async_client(get_openai_key()) as client:
+            return await analyze_text_full(text, instruction, placeholder, client)
+
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=build_messages(text, instruction),
+        temperature=0.2,
+        stream=True
     )
-    return resp.choices[0].message.content.strip()
+    parts = []
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            if placeholder is not None:
+                placeholder.markdown("".join(parts))
+    output = "".join(parts).strip()
+    cache.put(key, output)
+    return output
 
-def process_single_document(uploaded_file) -> str:
+def process_single_document(uploaded_file, placeholder=None) -> str:
     """
-    Extract text and run a single analysis call (no chunking).
+    Extract text and run a single analysis call (no chunking), streaming into placeholder if given.
     """
     text = extract_text_from_pdf(uploaded_file)
     if not text:
         return "⚠️ The uploaded PDF appears to be empty or unreadable."
     with st.spinner("Analyzing document..."):
-        analysis_output = analyze_text_full(
-            text,
-            "Analyze this legal PDF and produce a concise, structured result with these sections:\n"
-            "1. Parties\n2. Effective Date\n3. Term\n4. Confidential Information\n"
-            "5. Obligations\n6. Jurisdiction\n7. Risk Flags"
-        )
+        analysis_output = asyncio.run(analyze_text_full(text, ANALYSIS_INSTRUCTION, placeholder))
     return analysis_output
 
-def process_multiple_documents(files) -> dict:
+async def process_multiple_documents(files) -> dict:
     """
     For multiple PDFs, analyze each in a single pass (no chunking) and return a dict: {filename: analysis}.
+    PDFs are parsed on a thread pool, then all API calls run concurrently, bounded by MAX_CONCURRENT_REQUESTS.
     """
-    results = {}
-    for f in files:
-        with st.spinner(f"Analyzing {f.name}..."):
-            text = extract_text_from_pdf(f)
-            if not text:
-                results[f.name] = "⚠️ Empty or unreadable PDF."
-                continue
-            analysis_output = analyze_text_full(
-                text,
-                "Analyze this legal PDF and produce a concise, structured result with these sections:\n"
-                "1. Parties\n2. Effective Date\n3. Term\n4. Confidential Information\n"
-                "5. Obligations\n6. Jurisdiction\n7. Risk Flags"
-            )
-            results[f.name] = analysis_output
+    texts = extract_texts(files)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    # Live view of each file's analysis while responses stream in; cleared once all are done
+    live_area = st.empty()
+    with live_area.container():
+        placeholders = {name: st.expander(f"📄 {name}", expanded=True).empty() for name in texts}
+
+    async def analyze_one(client, name: str, text: str) -> str:
+        if not text:
+            return "⚠️ Empty or unreadable PDF."
+        async with semaphore:
+            return await analyze_text_full(text, ANALYSIS_INSTRUCTION, placeholders[name], client)
+
+    # Identical uploads (same extracted text) share a single API call
+    async def analyze_group(client, names: list) -> str:
+        output = await analyze_one(client, names[0], texts[names[0]])
+        for name in names[1:]:
+            placeholders[name].markdown(output)
+        return output
+
+    with st.spinner(f"Analyzing {len(texts)} documents..."):
+        async with make_async_client(get_openai_key()) as client:
+            results = await gather_by_content(texts, lambda names: analyze_group(client, names))
+    live_area.empty()
     return results
 
+def submit_analysis_batch(client, texts: dict) -> str:
+    """
+    Upload one /v1/chat/completions request per non-empty text as a Batch API job; returns the batch id.
+    """
+    lines = [
+        json.dumps({
+            "custom_id": name,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": ANALYSIS_MODEL,
+                "messages": build_messages(text, ANALYSIS_INSTRUCTION),
+                "temperature": 0.2,
+            },
+        })
+        for name, text in texts.items() if text
+    ]
+    batch_file = client.files.create(
+        file=("analysis_batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    try:
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+    except Exception:
+        client.files.delete(batch_file.id)  # don't leave the documents behind in OpenAI file storage
+        raise
+    return batch.id
+
+def read_batch_file(client, file_id) -> list:
+    """
+    Parse a batch output or error file into its JSONL rows ([] if the batch produced no such file).
+    """
+    if not file_id:
+        return []
+    return [json.loads(line) for line in client.files.content(file_id).text.splitlines() if line.strip()]
+
+def collect_batch_results(client, batch, files) -> dict:
+    """
+    Read a completed batch's output and error files into {filename: analysis}, in upload order.
+    """
+    by_name = {}
+    for row in read_batch_file(client, batch.output_file_id) + read_batch_file(client, batch.error_file_id):
+        body = (row.get("response") or {}).get("body") or {}
+        choices = body.get("choices")
+        if choices:
+            by_name[row["custom_id"]] = (choices[0]["message"]["content"] or "").strip()
+        else:
+            by_name[row["custom_id"]] = f"❌ Error: {row.get('error') or body.get('error')}"
+
+    def missing(f) -> str:
+        # Only empty files are left out of the batch; anything else went missing on OpenAI's side
+        if extract_text_from_pdf(f):
+            return "❌ Error: the batch returned no result for this file."
+        return "⚠️ Empty or unreadable PDF."
+
+    return {f.name: by_name[f.name] if f.name in by_name else missing(f) for f in files}
+
+def delete_batch_files(client, batch) -> None:
+    """
+    Delete a finished batch's input, output and error files, so no document text stays in OpenAI file storage.
+    """
+    for file_id in (batch.input_file_id, batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        try:
+            client.files.delete(file_id)
+        except Exception as e:
+            st.warning(f"⚠️ Could not delete batch file `{file_id}` from OpenAI: {e}")
+
+class PendingBatches:
+    """
+    Batch ids by upload-set key, plus the results of recently collected batches.
+    Held by the server process rather than st.session_state, so a batch outlives the browser
+    tab that submitted it: uploading the same files again picks it up.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.results = ResponseCache()  # collected results, kept for other tabs polling the same batch
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def lock_for(self, key) -> threading.Lock:
+        """
+        Lock held while submitting one upload set, so two tabs don't submit the same files twice.
+        Other upload sets, and tabs only polling a submitted batch, never wait on it.
+        """
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def pop(self, key):
+        """
+        Forget an upload set's batch (and its lock); returns the batch id, or None if already gone.
+        """
+        with self._locks_guard:
+            self._locks.pop(key, None)
+        return self.ids.pop(key, None)
+
+@st.cache_resource(show_spinner=False)
+def get_pending_batches() -> PendingBatches:
+    return PendingBatches()
+
+def run_batch_comparison(files):
+    """
+    Submit the uploads as a background batch (once per upload set) and poll it on each rerun.
+    Returns {filename: analysis} once the batch has completed, otherwise None.
+    """
+    key = ("batch", uploads_key(files))
+    pending = get_pending_batches()
+    results = get_stored_analysis(key) or pending.results.get(key)
+    if results is not None:
+        store_analysis(key, results)
+        return results
+
+    client = get_client()
+    batch_id = pending.ids.get(key)
+    if batch_id is None:
+        with pending.lock_for(key):
+            batch_id = pending.ids.get(key)  # another tab may have submitted while we waited
+            if batch_id is None:
+                texts = extract_texts(files)
+                if not any(texts.values()):
+                    results = {name: "⚠️ Empty or unreadable PDF." for name in texts}
+                    store_analysis(key, results)
+                    return results
+                with st.spinner("Submitting batch..."):
+                    batch_id = pending.ids[key] = submit_analysis_batch(client, texts)
+
+    batch = client.batches.retrieve(batch_id)
+    if batch.status in ("failed", "expired", "cancelled"):
+        if pending.pop(key) is not None:  # another tab may have cleaned up already
+            delete_batch_files(client, batch)
+        st.error(f"❌ Batch `{batch.id}` {batch.status}. Re-run to submit it again.")
+        return None
+    if batch.status != "completed":
+        st.info(
+            f"⏳ Batch `{batch.id}` is {batch.status}. Results can take up to 24 hours; you can close "
+            "this tab and upload the same files again later to collect them."
+        )
+        st.button("🔄 Check batch status")
+        return None
+
+    # Only one tab collects a batch. Its files are deleted whether or not collection succeeds, and
+    # the batch id is already dropped, so on failure the next rerun resubmits instead of failing again
+    if pending.pop(key) is None:
+        results = pending.results.get(key)
+        if results is None:
+            st.info(f"⏳ Batch `{batch.id}` is being collected in another tab.")
+            st.button("🔄 Check batch status")
+        return results
+    try:
+        results = collect_batch_results(client, batch, files)
+    except Exception as e:
+        st.error(f"❌ Could not read the results of batch `{batch.id}`: {e}. Re-run to submit it again.")
+        return None
+    finally:
+        delete_batch_files(client, batch)
+    pending.results.put(key, results)
+    store_analysis(key, results)
+    return results
+
+def uploads_key(files) -> tuple:
+    """
+    Identify a set of uploads by (name, content digest) for st.session_state lookups.
+    """
+    return tuple((f.name, content_digest(f.getvalue())) for f in files)
+
+def get_stored_analysis(key):
+    return st.session_state.get("analysis_results", {}).get(key)
+
+def store_analysis(key, results) -> None:
+    # Only the latest upload set is kept, so per-session memory stays bounded
+    st.session_state["analysis_results"] = {key: results}
+
+def render_comparison(analysis_results: dict) -> None:
+    st.subheader("Comparison Results")
+
+    # Section-based comparison table: one row per section, one column per file.
+    # Rows are plain dicts; st.dataframe renders them without building a pandas DataFrame here.
+    records = {fname: section_values(analysis_text) for fname, analysis_text in analysis_results.items()}
+    rows = [
+        {"Section": section, **{fname: record[section] for fname, record in records.items()}}
+        for section in SECTIONS
+    ]
+    st.dataframe(rows, hide_index=True)
+
+    st.subheader("🗂 Per-file Analysis")
+    for fname, analysis in analysis_results.items():
+        with st.expander(f"📄 {fname}", expanded=False):
+            st.write(analysis)
+
 def run_app():
     st.title("📄 ClauseMatrix: Browser-based Legal Analyzer")
 
@@ -142,9 +420,16 @@ def run_app():
                     st.error("Please upload a PDF file.")
                 else:
                     try:
-                        analysis_output = process_single_document(uploaded_file)
                         st.subheader("Analysis Result")
-                        st.write(analysis_output)
+                        key = ("single", uploads_key(uploaded_files))
+                        analysis_output = get_stored_analysis(key)
+                        if analysis_output is None:
+                            output_area = st.empty()
+                            analysis_output = process_single_document(uploaded_file, output_area)
+                            output_area.write(analysis_output)
+                            store_analysis(key, analysis_output)
+                        else:
+                            st.write(analysis_output)
                     except Exception as e:
                         st.error(f"❌ Error during analysis:\n\n{e}")
 
@@ -152,45 +437,26 @@ def run_app():
             if len(uploaded_files) < 2:
                 st.warning("Please upload at least two PDFs for comparison.")
             else:
+                use_batch = len(uploaded_files) > BATCH_THRESHOLD and st.checkbox(
+                    "📦 Run as a background batch (about half the cost; results within 24 hours)",
+                    help=(
+                        "Submits all files to the OpenAI Batch API. Documents are held by OpenAI until the results "
+                        "are collected, then deleted. You can close the tab while the batch runs: upload the same "
+                        "files again to collect it. If the app restarts before then, the batch and its files stay "
+                        "with OpenAI until they are deleted from the OpenAI dashboard."
+                    )
+                )
                 try:
-                    analysis_results = process_multiple_documents(uploaded_files)
-                    st.subheader("Comparison Results")
-
-                    # Section-based comparison table
-                    sections = [
-                        "Parties",
-                        "Effective Date",
-                        "Term",
-                        "Confidential Information",
-                        "Obligations",
-                        "Jurisdiction",
-                        "Risk Flags",
-                    ]
-
-                    def extract_section(analysis_text: str, section_name: str) -> str:
-                        pattern = rf"{section_name}\s*:([\s\S]*?)(?=\n[A-Z][A-Za-z ]+:\s*|$)"
-                        m = re.search(pattern, analysis_text, flags=re.IGNORECASE)
-                        return m.group(1).strip() if m else "Not specified"
-
-                    matrix = {section: {} for section in sections}
-                    for fname, analysis_text in analysis_results.items():
-                        for section in sections:
-                            matrix[section][fname] = extract_section(analysis_text, section)
-
-                    df_matrix = pd.DataFrame(matrix).T
-
-                    if df_matrix.empty or df_matrix.isna().all(axis=None):
-                        df_simple = pd.DataFrame.from_dict(
-                            analysis_results, orient="index", columns=["Analysis"]
-                        )
-                        st.dataframe(df_simple)
+                    if use_batch:
+                        analysis_results = run_batch_comparison(uploaded_files)
                     else:
-                        st.dataframe(df_matrix)
-
-                    st.subheader("🗂 Per-file Analysis")
-                    for fname, analysis in analysis_results.items():
-                        with st.expander(f"📄 {fname}", expanded=False):
-                            st.write(analysis)
+                        key = ("compare", uploads_key(uploaded_files))
+                        analysis_results = get_stored_analysis(key)
+                        if analysis_results is None:
+                            analysis_results = asyncio.run(process_multiple_documents(uploaded_files))
+                            store_analysis(key, analysis_results)
+                    if analysis_results is not None:
+                        render_comparison(analysis_results)
 
                 except Exception as e:
                     st.error(f"❌ Error during comparison analysis:\n\n{e}")
@@ -1,14 +1,18 @@
 
+import asyncio
+import hmac
 import os
 import streamlit as st
-from PyPDF2 import PdfReader
-from openai import OpenAI, RateLimitError
-from docx import Document
-from openpyxl import Workbook
 import json
-
-from PyPDF2 import PdfReader
 import io
+from openai_common import (
+    MAX_CONCURRENT_REQUESTS, ResponseCache, content_digest, gather_by_content, get_encoding, make_async_client,
+    make_client, response_cache_key
+)
+from pdf_extraction import extract_text_cached
+
+# Heavy modules (openai, PyMuPDF/PyPDF2, tiktoken, docx, openpyxl) are imported
+# where first used, so password-gate reruns stay cheap.
 
 # --- Safe PDF Text Extraction ---
 def safe_extract_text(uploaded_file):
@@ -16,21 +20,11 @@ def safe_extract_text(uploaded_file):
     Returns (text, error_message)."""
     try:
         # Ensure we're reading bytes
-        data = uploaded_file.read()
-        uploaded_file.seek(0)  # reset pointer for reuse
-        reader = PdfReader(io.BytesIO(data))
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        return text, None
+        data = uploaded_file.getvalue()
+        return extract_text_cached(content_digest(data), data), None
     except Exception as e:
         return None, str(e)
 
-# --- Load role-based questions from JSON ---
-json_path = os.path.join(os.path.dirname(__file__), "role_questions.json")
-with open(json_path, "r", encoding="utf-8") as f:
-    role_questions = json.load(f)
-
 # Set page config and app title (shown before password entry)
 st.set_page_config(page_title="ClauseMatrix Legal Analyzer", layout="wide")
 st.title("ClauseMatrix Legal Analyzer")
@@ -42,7 +36,7 @@ if "access_granted" not in st.session_state:
 
 if not st.session_state.access_granted:
     pwd = st.text_input("🔐 Please enter access password", type="password")
-    if pwd == PASSWORD:
+    if hmac.compare_digest(pwd.encode("utf-8"), PASSWORD.encode("utf-8")):
         st.session_state.access_granted = True
         st.rerun()
     else:
@@ -81,66 +75,126 @@ role = st.radio(
 st.markdown("### Please upload a single or multiple legal documents (PDF) for clause analysis", unsafe_allow_html=True)
 uploaded_files = st.file_uploader("Upload PDFs", type=["pdf"], accept_multiple_files=True)
 
-# --- Initialize OpenAI Client ---
-client = OpenAI()
+# --- OpenAI Client (created on first use) ---
+# Sync client is shared for the lifetime of the process so its connection pool stays warm;
+# AsyncOpenAI clients come from make_async_client(), one per asyncio.run()
+@st.cache_resource(show_spinner=False)
+def get_client():
+    return make_client()
+
+# Max tokens per chunk sent to summarize_clause (roughly the old 16,000-character slices)
+CHUNK_TOKENS = 4000
+
+# --- OpenAI Response Cache (in-memory only, nothing is written to disk) ---
+# Shared across reruns and sessions; entries expire after CACHE_TTL_SECONDS
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
+    return ResponseCache()
 
 # --- Load Role-Specific Sample Questions ---
-@st.cache_data
-def load_sample_questions():
-    with open("role_questions.json", "r") as f:
-        return json.load(f)
+json_path = os.path.join(os.path.dirname(__file__), "role_questions.json")
 
-role_questions = load_sample_questions()
+@st.cache_data(show_spinner=False)
+def load_sample_questions(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        import orjson  # Rust-backed parser; falls back to the stdlib if missing
+    except ImportError:
+        return json.loads(data)
+    return orjson.loads(data)
+
+role_questions = load_sample_questions(json_path)
 question_list = role_questions.get(role, [])
 
 # --- Helper Functions ---
-def extract_text_from_pdf(file):
-    reader = PdfReader(file)
-    return "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
+def iter_chunks(text, max_tokens=CHUNK_TOKENS):
+    """Yield chunks of at most max_tokens, splitting on line boundaries so clauses stay intact.
+    A single line longer than max_tokens is split on token offsets."""
+    enc = get_encoding("gpt-4o")
+    buf, count = [], 0
+    for line in text.split("\n"):
+        tokens = enc.encode_ordinary(line)  # "<|endoftext|>" etc. in a PDF is plain text, not an error
+        n = len(tokens) + 1  # +1 for the newline joining lines
+        if buf and count + n > max_tokens:
+            yield "\n".join(buf)
+            buf, count = [], 0
+        if n > max_tokens:
+            for i in range(0, len(tokens), max_tokens):
+                yield enc.decode(tokens[i:i+max_tokens])
+            continue
+        buf.append(line)
+        count += n
+    if buf:
+        yield "\n".join(buf)
 
-def summarize_clause(text, role):
+async def summarize_clause(text, role, semaphore, aclient):
+    from openai import RateLimitError
     system_prompt = f"You are a legal expert assisting a {role}. Analyze the following legal content and extract relevant clauses or issues in bullet points."
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
-            ],
-            temperature=0.2
-        )
-        return response.choices[0].message.content.strip()
-    except RateLimitError:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
-            ],
-            temperature=0.3
-        )
-        return "(Fallback to GPT-3.5)\n" + response.choices[0].message.content.strip()
+    cache = get_response_cache()
+    key = response_cache_key("gpt-4o", system_prompt, text)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    async with semaphore:
+        try:
+            response = await aclient.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": text}
+                ],
+                temperature=0.2
+            )
+            summary = response.choices[0].message.content.strip()
+            cache.put(key, summary)  # fallback answers are not cached
+            return summary
+        except RateLimitError:
+            response = await aclient.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": text}
+                ],
+                temperature=0.3
+            )
+            return "(Fallback to GPT-3.5)\n" + response.choices[0].message.content.strip()
+
+async def summarize_document(text, role, semaphore, aclient):
+    summaries = await asyncio.gather(*(summarize_clause(chunk, role, semaphore, aclient) for chunk in iter_chunks(text)))
+    return "\n".join(summaries)
+
+async def summarize_documents(texts, role):
+    """Summarize every document (and every chunk) concurrently; returns {filename: summary}."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    # Identical uploads (same extracted text) share a single summary
+    async with make_async_client() as aclient:
+        return await gather_by_content(texts, lambda names: summarize_document(texts[names[0]], role, semaphore, aclient))
 
 # --- Clause Analysis ---
 results = {}
 skipped = []
 if uploaded_files:
     st.markdown("### 🔍 Analysis in Progress...")
+    texts = {}
     for file in uploaded_files:
         text, err = safe_extract_text(file)   # <-- use the safe extractor
         if err:
             st.warning(f"⚠️ Skipped {file.name}: {err}")                   # <-- user gets a visible heads-up
             skipped.append(file.name)
             continue
+        texts[file.name] = text
 
-        if len(text) > 16000:
-            chunks = [text[i:i+16000] for i in range(0, len(text), 16000)]
-            summary = "\n".join([summarize_clause(chunk, role) for chunk in chunks])
-        else:
-            summary = summarize_clause(text, role)
-
-        results[file.name] = summary
-        st.markdown(f"#### 📄 Analysis for `{file.name}`:")
+    # Reuse this session's results unless the uploads or role changed
+    analysis_key = (role, tuple((name, content_digest(text.encode("utf-8"))) for name, text in texts.items()))
+    stored = st.session_state.get("analysis_results", {})
+    if analysis_key in stored:
+        results = stored[analysis_key]
+    else:
+        results = asyncio.run(summarize_documents(texts, role))
+        st.session_state["analysis_results"] = {analysis_key: results}  # keep only the latest run
+    for filename, summary in results.items():
+        st.markdown(f"#### 📄 Analysis for `{filename}`:")
         st.write(summary)
 
     if skipped:
@@ -153,35 +207,54 @@ if uploaded_files:
             "or using 'Print to PDF' from your viewer, then re-uploading it here."
         )        
     # Export to DOCX and XLSX
-    docx_path = os.path.join(os.getcwd(), "Clause_Summary.docx")
+    from docx import Document
+    from openpyxl import Workbook
+
+    # (built in memory; nothing is written to the working directory)
+    docx_buffer = io.BytesIO()
     docx = Document()
     for filename, summary in results.items():
         docx.add_heading(filename, level=2)
         docx.add_paragraph(summary)
-    docx.save(docx_path)
-    st.download_button("⬇️ Download Word Analysis", data=open(docx_path, "rb"), file_name="Clause_Summary.docx")
+    docx.save(docx_buffer)
+    st.download_button(
+        "⬇️ Download Word Analysis",
+        data=docx_buffer.getvalue(),
+        file_name="Clause_Summary.docx",
+        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    )
 
-    excel_path = os.path.join(os.getcwd(), "Clause_Summary.xlsx")
+    excel_buffer = io.BytesIO()
     wb = Workbook()
     ws = wb.active
     ws.title = "Clause Analysis"
     ws.append(["Filename", "Clause Analysis"])
     for filename, summary in results.items():
         ws.append([filename, summary])
-    wb.save(excel_path)
-    st.download_button("⬇️ Download Excel Analysis", data=open(excel_path, "rb"), file_name="Clause_Summary.xlsx")
+    wb.save(excel_buffer)
+    st.download_button(
+        "⬇️ Download Excel Analysis",
+        data=excel_buffer.getvalue(),
+        file_name="Clause_Summary.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
 
 # --- Ask AI with Dropdown ---
-st.markdown("## 🧠 Ask AI")
-selected_question = st.selectbox("Select a legal question relevant to your role:", question_list)
-if st.button("Submit Question") and selected_question:
-    followup_prompt = f"As a {role}, respond to the following legal question: {selected_question}"
-    followup_response = client.chat.completions.create(
+# Questions come from a fixed per-role list, so answers are cached on (role, question)
+@st.cache_data(show_spinner=False, max_entries=256)
+def ask_ai(role, question):
+    followup_prompt = f"As a {role}, respond to the following legal question: {question}"
+    followup_response = get_client().chat.completions.create(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": f"You are a helpful legal assistant for a {role}."},
             {"role": "user", "content": followup_prompt}
         ]
     )
+    return followup_response.choices[0].message.content.strip()
+
+st.markdown("## 🧠 Ask AI")
+selected_question = st.selectbox("Select a legal question relevant to your role:", question_list)
+if st.button("Submit Question") and selected_question:
     st.markdown("### 💡 AI Legal Insight")
-    st.write(followup_response.choices[0].message.content.strip())
+    st.write(ask_ai(role, selected_question))
@@ -1,22 +1,30 @@
 import streamlit as st
-import fitz  # PyMuPDF
+import asyncio
+import hmac
 import os
-from openai import OpenAI
 from dotenv import load_dotenv
-import pandas as pd
 import io
+from concurrent.futures import ThreadPoolExecutor
 
-# Load environment variables
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+# Environment and password are set up once per process, not on every rerun
+@st.cache_resource(show_spinner=False)
+def get_app_password():
+    load_dotenv()
+    return os.getenv("STREAMLIT_PASSWORD")
 
-# Password gate (same as single app)
-app_password = os.getenv("STREAMLIT_PASSWORD")
+# Password gate (same as single app); constant-time comparison, and no access at
+# all if STREAMLIT_PASSWORD is not configured
+app_password = get_app_password()
 entered_password = st.text_input("Enter access password", type="password")
-if entered_password != app_password:
+if not app_password or not hmac.compare_digest(entered_password.encode("utf-8"), app_password.encode("utf-8")):
     st.stop()
 
+# Heavy modules are imported only after the gate, so unauthenticated reruns stay cheap
+import fitz  # PyMuPDF
+import pandas as pd
+from openai_common import MAX_CONCURRENT_REQUESTS, ResponseCache, get_encoding, make_async_client, response_cache_key
+from summary_parsing import ROWS, parse_summary
+
 st.title("AI-Powered Legal PDF Summarizer – Multi-file Comparison")
 st.markdown("""
 Upload multiple legal PDFs (NDA, lease, contract) to generate a side-by-side
@@ -28,23 +36,122 @@ summary for comparison.
 3. Review the table and download it as Excel.
 """)
 
+# Cap on worker threads used to parse uploaded PDFs in parallel
+MAX_WORKERS = 8
+
+# Tokens of document text sent to the model per file (about the old 8000-character cap)
+MAX_INPUT_TOKENS = 2000
+
+# Extraction stops once this much raw text is collected (~4 characters per token,
+# with 2x headroom for the whitespace collapsed before truncation)
+EXTRACT_CHAR_BUDGET = 8 * MAX_INPUT_TOKENS
+
+# Plain-text extraction flags: PyMuPDF's text-mode defaults minus ligature
+# preservation (ligatures are expanded to plain letters) and image handling
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES & ~fitz.TEXT_PRESERVE_IMAGES
+
 # --- Helper: extract text ---
 def extract_text_from_pdf(file):
-    text = ""
-    pdf = fitz.open(stream=file.read(), filetype="pdf")
-    for page in pdf:
-        text += page.get_text()
-
-    # Form fields if present
-    if pdf.is_form_pdf:
-        text += "\n\nForm Fields:\n"
+    # getvalue() hands over UploadedFile's existing buffer (no copy in CPython) and,
+    # unlike read(), does not depend on or move the file position. The context manager
+    # frees MuPDF's page caches and buffers as soon as extraction is done, rather than
+    # whenever the wrapper happens to be garbage-collected
+    with fitz.open(stream=file.getvalue(), filetype="pdf") as pdf:
+        is_form_pdf = pdf.is_form_pdf
+
+        # One pass over the pages collects both the text and any form fields,
+        # stopping once there is more than the model will be sent. Fields come after
+        # all page text in the result, so they have their own counter: pages stop only
+        # on text_size, and fields stop once text and fields together cover the budget
+        parts = []
+        form_parts = []
+        text_size = 0
+        form_size = 0
         for page in pdf:
-            for widget in page.widgets():
-                field_name = widget.field_name if widget.field_name else "UnnamedField"
-                field_value = widget.field_value if widget.field_value else ""
-                text += f"{field_name}: {field_value}\n"
+            if text_size >= EXTRACT_CHAR_BUDGET:
+                break
+            page_text = page.get_text("text", flags=TEXT_FLAGS, sort=False)
+            parts.append(page_text)
+            text_size += len(page_text)
+            if is_form_pdf:
+                for widget in page.widgets():
+                    if text_size + form_size >= EXTRACT_CHAR_BUDGET:
+                        break
+                    field_name = widget.field_name if widget.field_name else "UnnamedField"
+                    field_value = widget.field_value if widget.field_value else ""
+                    form_parts.append(f"{field_name}: {field_value}\n")
+                    form_size += len(form_parts[-1])
+
+    text = "".join(parts)
+    if is_form_pdf:
+        text += "\n\nForm Fields:\n" + "".join(form_parts)
     return text
 
+# Static instructions go first as the system message and the document text last,
+# so every request shares an identical prefix for OpenAI's automatic prompt caching
+SYSTEM_PROMPT = """
+Summarize the following legal document with detailed sections.
+If any info is missing, write "Not specified".
+
+Return a JSON object with exactly these keys, each mapped to a string:
+- "Parties"
+- "Effective Date" (start, end, renewal terms)
+- "Term" (duration)
+- "Confidential Information"
+- "Obligations"
+- "Jurisdiction"
+- "Risk Flags"
+
+The user message contains the document text and any Form Fields.
+"""
+
+# --- Helper: summarize documents ---
+# In-memory summary cache keyed on (model, prompt, text), so re-processing the same
+# PDF skips the API call; nothing is written to disk, and entries expire after
+# CACHE_TTL_SECONDS
+@st.cache_resource(show_spinner=False)
+def get_summary_cache():
+    return ResponseCache()
+
+async def summarize_text(aclient, semaphore, text, model="gpt-4o-mini"):
+    cache = get_summary_cache()
+    key = response_cache_key(model, SYSTEM_PROMPT, text)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    async with semaphore:
+        response = await aclient.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": text}
+            ],
+            response_format={"type": "json_object"}
+        )
+    summary = response.choices[0].message.content
+    if summary is None:  # refusal: nothing to parse, and not worth caching
+        return None
+    cache.put(key, summary)
+    return summary
+
+async def summarize_texts(texts):
+    """Summarize all texts concurrently on one AsyncOpenAI client; results keep input order."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    async with make_async_client(os.getenv("OPENAI_API_KEY")) as aclient:
+        return await asyncio.gather(*(summarize_text(aclient, semaphore, text) for text in texts))
+
+def truncate_to_tokens(text, max_tokens=MAX_INPUT_TOKENS):
+    enc = get_encoding("gpt-4o-mini")
+    tokens = enc.encode_ordinary(text)  # "<|endoftext|>" etc. in a PDF is plain text, not an error
+    return text if len(tokens) <= max_tokens else enc.decode(tokens[:max_tokens])
+
+def prepare_text(file):
+    # Collapse whitespace so re-exported copies of the same contract (different line
+    # breaks/spacing) hit the same cache entry; truncate before the cache lookup so only
+    # the text actually sent is hashed
+    text = " ".join(extract_text_from_pdf(file).split())
+    return truncate_to_tokens(text)
+
 # Multi-file uploader
 uploaded_files = st.file_uploader(
     "Upload multiple PDFs", type="pdf", accept_multiple_files=True
@@ -53,53 +160,18 @@ uploaded_files = st.file_uploader(
 if uploaded_files and st.button("Process Files"):
     st.info("Processing all files...")
 
-    summaries = {}
-    # Summarize each file
-    for file in uploaded_files:
-        text = extract_text_from_pdf(file)
-
-        prompt = f"""
-        Summarize the following legal document with detailed sections.
-        If any info is missing, write "Not specified".
-
-        Sections to include:
-        1. Parties
-        2. Effective Date (start, end, renewal terms)
-        3. Term (duration)
-        4. Confidential Information
-        5. Obligations
-        6. Jurisdiction
-        7. Risk Flags
-
-        Document text and any Form Fields:
-        {text[:8000]}
-        """
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        summaries[file.name] = response.choices[0].message.content
+    # Parse all files on a thread pool, then fan the OpenAI calls out concurrently
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(uploaded_files))) as executor:
+        texts = list(executor.map(prepare_text, uploaded_files))
+    summaries = dict(zip((f.name for f in uploaded_files), asyncio.run(summarize_texts(texts))))
 
     # --- Build comparison table ---
-    # Each summary is split by lines and stored in DataFrame
-    rows = ["Parties", "Effective Date", "Term", "Confidential Information",
-            "Obligations", "Jurisdiction", "Risk Flags"]
-
-    data = {}
-    for fname, summary in summaries.items():
-        section_map = {}
-        for r in rows:
-            # Try to find a line containing that section
-            found = ""
-            for line in summary.splitlines():
-                if r.lower() in line.lower():
-                    found = line
-                    break
-            section_map[r] = found if found else "Not specified"
-        data[fname] = section_map
-
-    df = pd.DataFrame(data)
+    data = {fname: parse_summary(summary) for fname, summary in summaries.items()}
+
+    # One record per file, built in a single from_records call, then transposed so
+    # rows are sections and columns are files
+    records = [{"File": fname, **section_map} for fname, section_map in data.items()]
+    df = pd.DataFrame.from_records(records, columns=["File"] + ROWS).set_index("File").T
 
     st.subheader("Comparison Table")
     st.dataframe(df)
@@ -118,6 +190,6 @@ if uploaded_files and st.button("Process Files"):
     )
 
     st.write("### Full Summaries")
-    for fname, summary in summaries.items():
+    for fname, section_map in data.items():
         st.markdown(f"**{fname}**")
-        st.write(summary)
+        st.markdown("\n".join(f"- **{r}:** {value}" for r, value in section_map.items()))
@@ -0,0 +1,112 @@
+import asyncio
+import functools
+import hashlib
+import threading
+import time
+
+# Shared by the three Streamlit apps. Nothing here imports openai or httpx at module
+# level, so the apps can import it before their password gate.
+
+# Cap on in-flight OpenAI requests so large batches stay within rate limits
+MAX_CONCURRENT_REQUESTS = 8
+
+# Upper bound on cached OpenAI responses (oldest entries are evicted first)
+MAX_CACHED_RESPONSES = 256
+
+# Cached responses and extracted text are dropped after this long, so documents are
+# not kept in server memory long after the session that uploaded them
+CACHE_TTL_SECONDS = 15 * 60
+
+# HTTP/2 connection pool for OpenAI clients: keep-alive avoids a TLS handshake per
+# request, and HTTP/2 multiplexes concurrent requests over one connection
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+async def gather_by_content(texts, analyze):
+    """Await analyze(names) once per group of uploads with identical text, concurrently, and
+    return {name: result} in the order of texts. names lists the group's files in upload order.
+
+    >>> async def first(names): return names[0]
+    >>> asyncio.run(gather_by_content({"a.pdf": "x", "b.pdf": "y", "c.pdf": "x"}, first))
+    {'a.pdf': 'a.pdf', 'b.pdf': 'b.pdf', 'c.pdf': 'a.pdf'}
+    """
+    groups = {}
+    for name, text in texts.items():
+        groups.setdefault(content_digest(text.encode("utf-8")), []).append(name)
+    results = await asyncio.gather(*(analyze(names) for names in groups.values()))
+    by_name = {name: result for names, result in zip(groups.values(), results) for name in names}
+    return {name: by_name[name] for name in texts}
+
+def response_cache_key(model, instruction, text):
+    return hashlib.sha256("\x00".join((model, instruction, text)).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """In-memory store of OpenAI responses (nothing is written to disk). Entries expire
+    ttl seconds after they are stored, and the oldest is evicted beyond max_entries.
+    Safe to share across Streamlit sessions, which each run on their own thread.
+
+    >>> cache = ResponseCache(max_entries=2)
+    >>> cache.put("a", "1"); cache.put("b", "2"); cache.put("c", "3")
+    >>> cache.get("a"), cache.get("c")
+    (None, '3')
+    >>> expired = ResponseCache(ttl=0)
+    >>> expired.put("a", "1")
+    >>> expired.get("a") is None
+    True
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_RESPONSES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = {}  # key -> (expires_at, value), in insertion (and so expiry) order
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            now = time.monotonic()
+            self._entries.pop(key, None)
+            # Drop expired entries, then the oldest ones until there is room
+            while self._entries:
+                oldest = next(iter(self._entries))
+                if self._entries[oldest][0] > now and len(self._entries) < self.max_entries:
+                    break
+                del self._entries[oldest]
+            self._entries[key] = (now + self.ttl, value)
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """tiktoken encoding for model (o200k_base for the gpt-4o family), loaded once per process."""
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
+def _pool_limits():
+    import httpx
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+
+def make_client(api_key=None):
+    """Sync OpenAI client on an HTTP/2 connection pool. Cache it (st.cache_resource)
+    so the pool stays warm across reruns."""
+    import httpx
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=httpx.Client(http2=True, limits=_pool_limits()))
+
+def make_async_client(api_key=None):
+    """AsyncOpenAI client on an HTTP/2 connection pool, for one asyncio.run(). Its pool is
+    bound to the running event loop, so use it as `async with` rather than caching it."""
+    import httpx
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=api_key, http_client=httpx.AsyncClient(http2=True, limits=_pool_limits()))
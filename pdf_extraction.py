@@ -0,0 +1,24 @@
+import io
+
+import streamlit as st
+
+from openai_common import CACHE_TTL_SECONDS
+
+# Shared by app.py and app_fully_customized.py. PyMuPDF/PyPDF2 are imported on first use,
+# so the apps can import this before their password gate.
+
+@st.cache_data(show_spinner=False, max_entries=64, ttl=CACHE_TTL_SECONDS)
+def extract_text_cached(digest, _pdf_bytes):
+    """Parse PDF bytes into text (not stripped; callers decide). Cached across reruns on the
+    file's sha256 digest for up to CACHE_TTL_SECONDS (the leading underscore tells Streamlit
+    not to hash the bytes themselves)."""
+    try:
+        import fitz  # PyMuPDF: C-backed text extraction, much faster than PyPDF2
+    except ImportError:
+        fitz = None
+    if fitz is not None:
+        with fitz.open(stream=_pdf_bytes, filetype="pdf") as pdf:
+            return "".join(page.get_text() for page in pdf)
+    from PyPDF2 import PdfReader
+    reader = PdfReader(io.BytesIO(_pdf_bytes))
+    return "".join(page.extract_text() or "" for page in reader.pages)
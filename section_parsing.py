@@ -0,0 +1,73 @@
+import re
+
+# Splits the free-text analyses app.py gets back from the model into comparison-table rows.
+# Stdlib only, so the doctests run with `python -m doctest section_parsing.py`.
+
+# Sections shown in the comparison table
+SECTIONS = [
+    "Parties",
+    "Effective Date",
+    "Term",
+    "Confidential Information",
+    "Obligations",
+    "Jurisdiction",
+    "Risk Flags",
+]
+
+# Per-section fallback patterns, compiled once at import for extract_section
+SECTION_PATTERNS = {
+    section: re.compile(rf"{re.escape(section)}\s*:([\s\S]*?)(?=\n[A-Z][A-Za-z ]+:\s*|$)", re.IGNORECASE)
+    for section in SECTIONS
+}
+
+def extract_section(analysis_text: str, section_name: str) -> str:
+    """
+    Fallback lookup for a section parse_sections could not find (e.g. a heading in mid-line).
+    """
+    m = SECTION_PATTERNS[section_name].search(analysis_text)
+    return m.group(1).strip() if m else "Not specified"
+
+# One of SECTIONS as a heading at the start of a line, e.g. "Parties:", "2. Effective Date:",
+# "**Term** (duration):" or "### 7. Risk Flags" on a line of its own. Only these names split the
+# text, so a numbered sub-item like "1. Use care:" stays inside its section. "*" only counts as
+# emphasis glued to the name: "- Term: auto-renews" or "* Term: ..." bullets inside Risk Flags
+# are part of that section, not new headings
+SECTION_HEADING_RE = re.compile(
+    r"^[ \t#]*\**(?:\d+\.\s*)?\**(" + "|".join(map(re.escape, SECTIONS)) + r")\**[ \t]*(?:\([^)\n]*\))?[ \t]*(?::\**|\**[ \t]*$)",
+    re.IGNORECASE | re.MULTILINE
+)
+
+def parse_sections(analysis_text: str) -> dict:
+    """
+    Split an analysis into {section title: content} in a single pass over its headings.
+    The first occurrence of a heading wins; titles are normalized to title case.
+
+    >>> parse_sections("### 1. **Parties**\\nAcme\\n**2. Effective Date:** 2024-01-01\\n**Term** (duration): 2 years")
+    {'Parties': 'Acme', 'Effective Date': '2024-01-01', 'Term': '2 years'}
+    """
+    matches = list(SECTION_HEADING_RE.finditer(analysis_text))
+    parsed = {}
+    for m, nxt in zip(matches, matches[1:] + [None]):
+        end = nxt.start() if nxt else len(analysis_text)
+        parsed.setdefault(m.group(1).strip().title(), analysis_text[m.end():end].strip())
+    return parsed
+
+def section_values(analysis_text: str) -> dict:
+    """
+    {section: content} for every entry in SECTIONS, using extract_section for any parse_sections missed.
+
+    >>> values = section_values("Risk Flags: Several concerns\\n- Term: auto-renews without notice\\n- Jurisdiction: forum is remote")
+    >>> print(values["Risk Flags"])
+    Several concerns
+    - Term: auto-renews without notice
+    - Jurisdiction: forum is remote
+    >>> values = section_values("Parties: Acme and Beta\\nTerm: 2 years\\nRisk Flags: Several concerns\\n* Term: auto-renews without notice\\n* Jurisdiction: forum is remote")
+    >>> values["Term"]
+    '2 years'
+    >>> print(values["Risk Flags"])
+    Several concerns
+    * Term: auto-renews without notice
+    * Jurisdiction: forum is remote
+    """
+    parsed = parse_sections(analysis_text)
+    return {section: parsed.get(section) or extract_section(analysis_text, section) for section in SECTIONS}
@@ -0,0 +1,57 @@
+import json
+import re
+
+# Comparison table rows; the summary prompt asks for a JSON object with exactly these keys
+ROWS = ["Parties", "Effective Date", "Term", "Confidential Information",
+        "Obligations", "Jurisdiction", "Risk Flags"]
+
+# A complete `"Row": "value"` pair anywhere in a reply, used to salvage what we can
+# from a JSON object that was cut off (e.g. the reply hit the output-token limit)
+JSON_PAIR_RE = re.compile(
+    r'"(' + "|".join(map(re.escape, ROWS)) + r')"\s*:\s*"((?:[^"\\]|\\.)*)"'
+)
+
+def format_value(value):
+    """Flatten a JSON value into one table cell: lists become "a; b", objects
+    become "key: value; key: value", and null becomes "Not specified"."""
+    if value is None:
+        return "Not specified"
+    if isinstance(value, list):
+        return "; ".join(format_value(v) for v in value)
+    if isinstance(value, dict):
+        return "; ".join(f"{k}: {format_value(v)}" for k, v in value.items())
+    return str(value).strip()
+
+def parse_summary(summary):
+    """Map a summary to {row: value}, with "Not specified" for anything missing.
+    Summaries are JSON objects; if one is not valid JSON (e.g. truncated), the
+    complete "key": "value" pairs before the cut are kept. A missing reply (the
+    model refused, so content is None) yields all "Not specified".
+
+    >>> parse_summary('{"Parties": "Acme; Beta", "Term": ["2 years", "auto-renews"]}')["Term"]
+    '2 years; auto-renews'
+    >>> parse_summary('{"Effective Date": {"start": "2024-01-01", "end": null, "renewal terms": "auto"}}')["Effective Date"]
+    'start: 2024-01-01; end: Not specified; renewal terms: auto'
+    >>> rows = parse_summary('{\\n  "Parties": "Acme \\\\"Holdings\\\\"",\\n  "Term": "2 ye')
+    >>> rows["Parties"], rows["Term"]
+    ('Acme "Holdings"', 'Not specified')
+    >>> parse_summary(None)["Parties"]
+    'Not specified'
+    """
+    try:
+        parsed = json.loads(summary or "{}")
+    except json.JSONDecodeError:
+        parsed = {}
+        for m in JSON_PAIR_RE.finditer(summary):
+            try:
+                value = json.loads(f'"{m.group(2)}"', strict=False)
+            except json.JSONDecodeError:  # malformed escape: keep the raw text
+                value = m.group(2)
+            parsed.setdefault(m.group(1), value)
+    if not isinstance(parsed, dict):
+        parsed = {}
+
+    section_map = {}
+    for r in ROWS:
+        section_map[r] = format_value(parsed.get(r)) or "Not specified"
+    return section_map